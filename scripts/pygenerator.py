@@ -15,8 +15,18 @@
 # limitations under the License.
 
 import sys
-from generator import OutputGenerator, enquote, noneStr, write
-from pprint import pprint
+from generator import OutputGenerator, enquote
+
+# formatDict - returns Python source assigning a dictionary display to a
+#   variable, with one entry per line in sorted key order.
+#   name - variable name to assign
+#   entry_dict - dictionary whose values are already Python source text
+def formatDict(name, entry_dict):
+    lines = [name + ' = {']
+    for key in sorted(entry_dict):
+        lines.append(f'    {enquote(key)}: {entry_dict[key]},')
+    lines.append('}\n')
+    return '\n'.join(lines)
 
 # PyOutputGenerator - subclass of OutputGenerator.
 # Generates Python data structures describing API names and relationships.
@@ -36,11 +46,32 @@ from pprint import pprint
 class PyOutputGenerator(OutputGenerator):
     """Generate specified API interfaces in a specific style, such as a C header"""
 
+    # Per-file state set up in beginFile(). OutputGenerator does not use
+    # __slots__, so instances still have a __dict__ for its attributes.
+    __slots__ = ('basetypes', 'consts', 'enums', 'flags', 'funcpointers',
+                 'protos', 'structs', 'handles', 'defines', 'alias',
+                 'typeCategory', 'mapDict',
+                 '_apiNameCache', '_isApiName', '_diagEnabled')
+
+    # Quoted forms of the category names stored in typeCategory, which
+    # recur for almost every entity, so addName() need not requote them.
+    _quotedCategories = {
+        category: enquote(category)
+        for category in ('struct', 'union', 'bitmask', 'enum', 'funcpointer',
+                         'handle', 'define', 'basetype', 'consts', 'protos')
+    }
+
     def apiName(self, name):
         """Returns True if name is in the reserved API namespace.
-           Delegate to the conventions object.
+           Delegate to the conventions object, caching the result since
+           the same type names are queried repeatedly.
         """
-        return self.genOpts.conventions.is_api_name(name)
+        try:
+            return self._apiNameCache[name]
+        except KeyError:
+            isApiName = self._isApiName(name)
+            self._apiNameCache[name] = isApiName
+            return isApiName
 
     def beginFile(self, genOpts):
         OutputGenerator.beginFile(self, genOpts)
@@ -48,7 +79,7 @@ class PyOutputGenerator(OutputGenerator):
         # Dictionaries are keyed by the name of the entity (e.g.
         # self.structs is keyed by structure names). Values are
         # the names of related entities (e.g. structs contain
-        # a list of type names of members, enums contain a list
+        # a tuple of type names of members, enums contain a tuple
         # of enumerants belong to the enumerated type, etc.), or
         # just None if there are no directly related entities.
         #
@@ -66,7 +97,14 @@ class PyOutputGenerator(OutputGenerator):
         # Dictionary containing the type of a type name
         # (e.g. the string name of the dictionary with its contents).
         self.typeCategory = {}
+        # Dictionary containing the set of types related to a type name
         self.mapDict = {}
+        # Cache of apiName() results, keyed by name, and the bound
+        # conventions method used to fill it
+        self._apiNameCache = {}
+        self._isApiName = self.genOpts.conventions.is_api_name
+        # Skip building diagnostic messages that logMsg() would discard
+        self._diagEnabled = self.diagFile is not None
 
     def endFile(self):
         # Print out all the dictionaries as Python strings.
@@ -82,52 +120,56 @@ class PyOutputGenerator(OutputGenerator):
                   [ self.defines,       'defines' ],
                   [ self.typeCategory,  'typeCategory' ],
                   [ self.alias,         'alias' ] )
-        for (entry_dict, name) in dicts:
-            write(name + ' = {}', file=self.outFile)
-            for key in sorted(entry_dict.keys()):
-                write(name + '[' + enquote(key) + '] = ', entry_dict[key],
-                      file=self.outFile)
+        # Emit each dictionary as a single dict display.
+        # The values are already Python source text (see addName()).
+        chunks = [formatDict(name, entry_dict)
+                  for (entry_dict, name) in dicts]
 
         # Dictionary containing the relationships of a type
-        # (e.g. a dictionary with each related type as keys).
-        write('mapDict = {}', file=self.outFile)
-
+        # (e.g. a list of the related types).
         # Could just print(self.mapDict), but prefer something
         # human-readable and stable-ordered
-        for baseType in sorted(self.mapDict.keys()):
-            write('mapDict[' + enquote(baseType) + '] = ', file=self.outFile, end='')
-            pprint(self.mapDict[baseType], self.outFile)
+        mapSource = {baseType: repr(sorted(refTypes))
+                     for baseType, refTypes in self.mapDict.items()}
+        chunks.append(formatDict('mapDict', mapSource))
+
+        # Write the whole module at once
+        self.outFile.write(''.join(chunks))
 
         OutputGenerator.endFile(self)
 
     # Add a string entry to the dictionary, quoting it so it gets printed
     # out correctly in self.endFile()
     def addName(self, entry_dict, name, value):
-        entry_dict[name] = enquote(value)
+        if entry_dict is self.typeCategory:
+            entry_dict[name] = self._quotedCategories.get(value) or enquote(value)
+        else:
+            entry_dict[name] = enquote(value)
 
     # Add a mapping between types to mapDict. Only include API types,
     # so we don't end up with a lot of useless uint32_t and void types.
     def addMapping(self, baseType, refType):
-        if not self.apiName(baseType) or not self.apiName(refType):
-            self.logMsg('diag', 'PyOutputGenerator::addMapping: IGNORE map from', baseType, '<->', refType)
+        if not self.apiName(baseType):
+            if self._diagEnabled:
+                self.logMsg('diag', 'PyOutputGenerator::addMapping: IGNORE map from', baseType, '<->', refType)
             return
 
-        self.logMsg('diag', 'PyOutputGenerator::addMapping: map from',
-                    baseType, '<->', refType)
+        self.addRefMapping(baseType, refType)
 
-        if baseType not in self.mapDict:
-            baseDict = {}
-            self.mapDict[baseType] = baseDict
-        else:
-            baseDict = self.mapDict[baseType]
-        if refType not in self.mapDict:
-            refDict = {}
-            self.mapDict[refType] = refDict
-        else:
-            refDict = self.mapDict[refType]
+    # As addMapping(), for callers that have already checked that baseType
+    # is an API type and are adding many mappings from it.
+    def addRefMapping(self, baseType, refType):
+        if not self.apiName(refType):
+            if self._diagEnabled:
+                self.logMsg('diag', 'PyOutputGenerator::addMapping: IGNORE map from', baseType, '<->', refType)
+            return
+
+        if self._diagEnabled:
+            self.logMsg('diag', 'PyOutputGenerator::addMapping: map from',
+                        baseType, '<->', refType)
 
-        baseDict[refType] = None
-        refDict[baseType] = None
+        self.mapDict.setdefault(baseType, set()).add(refType)
+        self.mapDict.setdefault(refType, set()).add(baseType)
 
     # Type generation
     # For 'struct' or 'union' types, defer to genStruct() to
@@ -168,9 +210,9 @@ class PyOutputGenerator(OutputGenerator):
                 # Extract the type name
                 # (from self.genOpts). Copy other text through unchanged.
                 # If the resulting text is an empty string, don't emit it.
-                count = len(noneStr(typeElem.text))
-                for elem in typeElem:
-                    count += len(noneStr(elem.text)) + len(noneStr(elem.tail))
+                count = len(typeElem.text or '') + sum(
+                    len(elem.text or '') + len(elem.tail or '')
+                    for elem in typeElem)
 
             if count > 0:
                 if category == 'bitmask':
@@ -199,36 +241,44 @@ class PyOutputGenerator(OutputGenerator):
                     if self.apiName(name):
                         self.basetypes[name] = None
                         self.addName(self.typeCategory, name, 'basetype')
-                    else:
+                    elif self._diagEnabled:
                         self.logMsg('diag', 'PyOutputGenerator::genType: unprocessed type:', name, 'category:', category)
-            else:
+            elif self._diagEnabled:
                 self.logMsg('diag', 'PyOutputGenerator::genType: unprocessed type:', name)
 
     # Struct (e.g. C "struct" type) generation.
     #
     # Add the struct name to the 'structs' dictionary, with the
-    # value being an ordered list of the struct member names.
+    # value being an ordered tuple of the struct member names.
     def genStruct(self, typeinfo, typeName, alias):
         OutputGenerator.genStruct(self, typeinfo, typeName, alias)
 
         if alias:
             # Add name -> alias mapping
             self.addName(self.alias, typeName, alias)
-        else:
-            # May want to only emit definition on this branch
-            True
 
-        members = [member.text for member in typeinfo.elem.findall('.//member/name')]
-        self.structs[typeName] = members
-        memberTypes = [member.text for member in typeinfo.elem.findall('.//member/type')]
-        for member_type in memberTypes:
-            self.addMapping(typeName, member_type)
+        # Collect member names and types in a single pass over the members.
+        # The same names recur across many structs, so intern them.
+        members = []
+        memberTypes = []
+        for member in typeinfo.elem:
+            if member.tag != 'member':
+                continue
+            members.append(sys.intern(member.findtext('name')))
+            # A member need not have a <type> (e.g. 'int'), so skip those
+            memberType = member.findtext('type')
+            if memberType is not None:
+                memberTypes.append(sys.intern(memberType))
+        self.structs[typeName] = tuple(members)
+        if self.apiName(typeName):
+            for member_type in memberTypes:
+                self.addRefMapping(typeName, member_type)
 
     # Group (e.g. C "enum" type) generation.
     # These are concatenated together with other types.
     #
     # Add the enum type name to the 'enums' dictionary, with
-    #   the value being an ordered list of the enumerant names.
+    #   the value being an ordered tuple of the enumerant names.
     # Add each enumerant name to the 'consts' dictionary, with
     #   the value being the enum type the enumerant is part of.
     def genGroup(self, groupinfo, groupName, alias):
@@ -238,12 +288,10 @@ class PyOutputGenerator(OutputGenerator):
         if alias:
             # Add name -> alias mapping
             self.addName(self.alias, groupName, alias)
-        else:
-            # May want to only emit definition on this branch
-            True
 
         # Loop over the nested 'enum' tags.
-        enumerants = [elem.get('name') for elem in groupElem.findall('enum')]
+        enumerants = tuple(sys.intern(elem.get('name')) for elem in groupElem
+                           if elem.tag == 'enum')
         for name in enumerants:
             self.addName(self.consts, name, groupName)
         self.enums[groupName] = enumerants
@@ -264,22 +312,30 @@ class PyOutputGenerator(OutputGenerator):
     # Command generation
     #
     # Add the command name to the 'protos' dictionary, with the
-    #   value being an ordered list of the parameter names.
+    #   value being an ordered tuple of the parameter names.
     def genCmd(self, cmdinfo, name, alias):
         OutputGenerator.genCmd(self, cmdinfo, name, alias)
 
         if alias:
             # Add name -> alias mapping
             self.addName(self.alias, name, alias)
-        else:
-            # May want to only emit definition on this branch
-            True
 
         # Add a typeCategory{} entry for the category of this type.
         self.addName(self.typeCategory, name, 'protos')
 
-        params = [param.text for param in cmdinfo.elem.findall('param/name')]
-        self.protos[name] = params
-        paramTypes = [param.text for param in cmdinfo.elem.findall('param/type')]
-        for param_type in paramTypes:
-            self.addMapping(name, param_type)
+        # Collect parameter names and types in a single pass over the params.
+        # The same names recur across many commands, so intern them.
+        params = []
+        paramTypes = []
+        for param in cmdinfo.elem:
+            if param.tag != 'param':
+                continue
+            params.append(sys.intern(param.findtext('name')))
+            # A param need not have a <type> (e.g. 'int'), so skip those
+            paramType = param.findtext('type')
+            if paramType is not None:
+                paramTypes.append(sys.intern(paramType))
+        self.protos[name] = tuple(params)
+        if self.apiName(name):
+            for param_type in paramTypes:
+                self.addRefMapping(name, param_type)
@@ -1,4 +1,4 @@
-#!/usr/bin/python3 -i
+#!/usr/bin/python3
 #
 # Copyright (c) 2019 Collabora, Ltd.
 #
@@ -18,12 +18,16 @@
 """Provides utilities to write a script to verify XML registry consistency."""
 
 import re
+from collections import defaultdict
 
 from .algo import RecursiveMemoize
 from .attributes import ExternSyncEntry, LengthEntry
-from .util import findNamedElem, getElemName
+from .util import getElemName
 from .data_structures import DictOfStringSets
 
+_CONST_RE = re.compile(r"\bconst\b")
+_ARRAY_RE = re.compile(r"\[[^]]+\]")
+
 
 class XMLChecker:
     def __init__(self, entity_db,  conventions, manual_types_to_codes=None,
@@ -56,11 +60,15 @@ class XMLChecker:
         self.warnings = DictOfStringSets()
         self.db = entity_db
         self.reg = entity_db.registry
+        self.reg_filename = self.reg.filename
         self.handle_data = HandleData(self.reg)
         self.conventions = conventions
 
-        self.CONST_RE = re.compile(r"\bconst\b")
-        self.ARRAY_RE = re.compile(r"\[[^]]+\]")
+        # Cache of the (is_api_type, is_input) classification of
+        # member/param elements, keyed by the element itself so that it
+        # stays alive (lxml elements are recreated on access, so their
+        # id() can be reused).
+        self._classification_cache = {}
 
         # Init memoized properties
         self._handle_data = None
@@ -94,42 +102,54 @@ class XMLChecker:
             reverse_codes
         )
 
-        self.referenced_input_types = ReferencedTypes(self.db, self.is_input)
-        self.referenced_api_types = ReferencedTypes(self.db, self.is_api_type)
+        self.referenced_types = ReferencedInputAndApiTypes(
+            self.db, self.is_input, self.is_api_type)
         if not suppressions:
             suppressions = {}
         self.suppressions = DictOfStringSets(suppressions)
 
-    def is_api_type(self, member_elem):
-        """Return true if the member/parameter ElementTree passed is from this API.
+    def _classify_member(self, member_elem):
+        """Return a tuple (is_api_type, is_input) for a member/parameter element.
 
-        May override or extend."""
-        membertext = "".join(member_elem.itertext())
-
-        return self.conventions.type_prefix in membertext
+        Both are decided from a single scan of the member text,
+        once per element, and cached."""
+        classification = self._classification_cache.get(member_elem)
+        if classification is not None:
+            return classification
 
-    def is_input(self, member_elem):
-        """Return true if the member/parameter ElementTree passed is
-        considered "input".
-
-        May override or extend."""
         membertext = "".join(member_elem.itertext())
 
         if self.conventions.type_prefix not in membertext:
-            return False
+            classification = (False, False)
 
-        ret = True
         # Const is always input.
-        if self.CONST_RE.search(membertext):
-            ret = True
+        elif _CONST_RE.search(membertext):
+            classification = (True, True)
 
         # Arrays and pointers that aren't const are always output.
         elif "*" in membertext:
-            ret = False
-        elif self.ARRAY_RE.search(membertext):
-            ret = False
+            classification = (True, False)
+        elif _ARRAY_RE.search(membertext):
+            classification = (True, False)
+
+        else:
+            classification = (True, True)
 
-        return ret
+        self._classification_cache[member_elem] = classification
+        return classification
+
+    def is_api_type(self, member_elem):
+        """Return true if the member/parameter ElementTree passed is from this API.
+
+        May override or extend."""
+        return self._classify_member(member_elem)[0]
+
+    def is_input(self, member_elem):
+        """Return true if the member/parameter ElementTree passed is
+        considered "input".
+
+        May override or extend."""
+        return self._classify_member(member_elem)[1]
 
     def add_extra_codes(self, types_to_codes):
         """Add any desired entries to the types-to-codes DictOfStringSets
@@ -182,8 +202,7 @@ class XMLChecker:
             self.set_error_context(entity=name, elem=info.elem)
             self.check_extension(name, info)
 
-        entities_with_messages = set(
-            self.errors.keys()).union(self.warnings.keys())
+        entities_with_messages = self.errors.keys() | self.warnings.keys()
 
         for entity in entities_with_messages:
             print()
@@ -206,6 +225,10 @@ class XMLChecker:
         Called from check_params.
 
         May extend."""
+        if param.get('externsync') is None:
+            # Nothing else to check here.
+            return
+
         param_name = getElemName(param)
         externsyncs = ExternSyncEntry.parse_externsync_from_param(param)
         if externsyncs:
@@ -228,9 +251,17 @@ class XMLChecker:
         Called from check_type and check_command.
 
         May extend."""
+        # Params referenced by name, looked up in one step rather than
+        # searching the list for each reference. Built on the first len=
+        # reference, since most structs and commands have none.
+        params_by_name = None
+
         for param in params:
             self.check_param(param)
 
+            if param.get('len') is None:
+                continue
+
             # Check for parameters referenced by len= attribute
             lengths = LengthEntry.parse_len_from_param(param)
             if lengths:
@@ -239,7 +270,13 @@ class XMLChecker:
                         continue
                     # TODO only looking at the superficial feature here,
                     # not entry.param_ref_parts
-                    other_param = findNamedElem(params, entry.other_param_name)
+                    if params_by_name is None:
+                        # Keep the first param with a given name,
+                        # as findNamedElem would return.
+                        params_by_name = {}
+                        for other in params:
+                            params_by_name.setdefault(getElemName(other), other)
+                    other_param = params_by_name.get(entry.other_param_name)
                     if other_param is None:
                         self.record_error("References a non-existent parameter/member in the length of",
                                           getElemName(param), ":", entry.other_param_name)
@@ -254,7 +291,9 @@ class XMLChecker:
             if not name.startswith(self.conventions.type_prefix):
                 self.record_error("Name does not start with",
                                   self.conventions.type_prefix)
-            self.check_params(info.elem.findall('member'))
+            members = info.elem.findall('member')
+            if members:
+                self.check_params(members)
 
         elif category == "bitmask":
             if 'Flags' not in name:
@@ -276,33 +315,25 @@ class XMLChecker:
         May extend."""
         elem = info.elem
 
-        self.check_params(elem.findall('param'))
+        params = elem.findall('param')
+        if params:
+            self.check_params(params)
 
-        # Some minimal return code checking
-        errorcodes = elem.get("errorcodes")
-        if errorcodes:
-            errorcodes = errorcodes.split(",")
-        else:
-            errorcodes = []
-
-        successcodes = elem.get("successcodes")
-        if successcodes:
-            successcodes = successcodes.split(",")
-        else:
-            successcodes = []
+        # Some minimal return code checking.
+        # Create a set for each group of codes, and check that
+        # they aren't duplicated within or between groups.
+        errorcodes_set, errorcodes_dup = _split_codes(elem.get("errorcodes"))
+        successcodes_set, successcodes_dup = _split_codes(
+            elem.get("successcodes"))
 
-        if not successcodes and not errorcodes:
+        if not successcodes_set and not errorcodes_set:
             # Early out if no return codes.
             return
 
-        # Create a set for each group of codes, and check that
-        # they aren't duplicated within or between groups.
-        errorcodes_set = set(errorcodes)
-        if len(errorcodes) != len(errorcodes_set):
+        if errorcodes_dup:
             self.record_error("Contains a duplicate in errorcodes")
 
-        successcodes_set = set(successcodes)
-        if len(successcodes) != len(successcodes_set):
+        if successcodes_dup:
             self.record_error("Contains a duplicate in successcodes")
 
         if not successcodes_set.isdisjoint(errorcodes_set):
@@ -345,8 +376,8 @@ class XMLChecker:
         `self.should_skip_checking_codes(name)` is False.
 
         May extend."""
-        referenced_input = self.referenced_input_types[name]
-        referenced_types = self.referenced_api_types[name]
+        referenced_input = self.referenced_types.input(name)
+        referenced_types = self.referenced_types.api(name)
 
         # Check that we have all the codes we expect, based on input types.
         for referenced_type in referenced_input:
@@ -388,28 +419,32 @@ class XMLChecker:
         self.entity = entity
         self.elem = elem
         self.name = getElemName(elem)
-        self.entity_suppressions = self.suppressions.get(getElemName(elem))
+        self.entity_suppressions = self.suppressions.get(self.name)
 
     def record_error(self, *args, **kwargs):
         """Record failure and an error message for the current context."""
-        message = " ".join((str(x) for x in args))
+        message = " ".join(map(str, args))
 
+        # entity_suppressions is None for the usual unsuppressed entity,
+        # so this is a single test in the common case.
         if self.entity_suppressions and message in self.entity_suppressions:
             return
 
         message = self._prepend_sourceline_to_message(message, **kwargs)
         self.fail = True
-        self.errors.add(self.entity, message)
+        # Add to the underlying dict directly, skipping the conversions
+        # in DictOfStringSets.add() for a single string.
+        self.errors.get_dict().setdefault(self.entity, set()).add(message)
 
     def record_warning(self, *args, **kwargs):
         """Record a warning message for the current context."""
-        message = " ".join((str(x) for x in args))
+        message = " ".join(map(str, args))
 
         if self.entity_suppressions and message in self.entity_suppressions:
             return
 
         message = self._prepend_sourceline_to_message(message, **kwargs)
-        self.warnings.add(self.entity, message)
+        self.warnings.get_dict().setdefault(self.entity, set()).add(message)
 
     def _prepend_sourceline_to_message(self, message, **kwargs):
         """Prepend a file and/or line reference to the message, if possible.
@@ -430,19 +465,19 @@ class XMLChecker:
             elem = kwargs.get('elem', self.elem)
             if elem is not None:
                 sourceline = getattr(elem, 'sourceline', None)
-                if self.reg.filename:
-                    fn = self.reg.filename
+                if self.reg_filename:
+                    fn = self.reg_filename
 
         if fn is None and sourceline is None:
             return message
 
         if fn is None:
-            return "Line {}: {}".format(sourceline, message)
+            return f"Line {sourceline}: {message}"
 
         if sourceline is None:
-            return "{}: {}".format(fn, message)
+            return f"{fn}: {message}"
 
-        return "{}:{}: {}".format(fn, sourceline, message)
+        return f"{fn}:{sourceline}: {message}"
 
 
 class HandleParents(RecursiveMemoize):
@@ -456,15 +491,15 @@ class HandleParents(RecursiveMemoize):
 
         if immediate_parent is None:
             # No parents, no need to recurse
-            return []
+            return set()
 
         # Support multiple (alternate) parents
         immediate_parents = immediate_parent.split(',')
 
         # Recurse, combine, and return
-        all_parents = immediate_parents[:]
+        all_parents = set(immediate_parents)
         for parent in immediate_parents:
-            all_parents.extend(self[parent])
+            all_parents.update(self[parent])
         return all_parents
 
 
@@ -472,37 +507,131 @@ def _always_true(x):
     return True
 
 
+def _split_codes(codes):
+    """Split a comma-separated return code attribute value.
+
+    Returns a tuple of the set of codes and whether any code was
+    duplicated."""
+    if not codes:
+        return set(), False
+    code_list = codes.split(",")
+    code_set = set(code_list)
+    return code_set, len(code_list) != len(code_set)
+
+
 class ReferencedTypes(RecursiveMemoize):
     """Find all types(optionally matching a predicate) that are referenced
     by a struct or function, recursively."""
 
-    def __init__(self, db, predicate=None):
+    def __init__(self, db, predicate=None, member_types=None):
         """Initialize.
 
-        Provide an EntityDB object and a predicate function."""
+        Provide an EntityDB object and a predicate function.
+        member_types, if supplied, is a dict caching the (member element,
+        type name) pairs of each entity, to share with another
+        ReferencedTypes object over the same EntityDB."""
         self.db = db
 
         self.predicate = predicate
         if not self.predicate:
             # Default predicate is "anything goes"
             self.predicate = _always_true
+
+        # Cache of (member element, type name) pairs by entity name
+        self._member_types = member_types
+        if self._member_types is None:
+            self._member_types = {}
         super().__init__(permit_cycles=True)
 
+    def member_types(self, type_name):
+        """Return (member element, type name) pairs for the members/params
+        of type_name that have a type, extracted once and cached."""
+        pairs = self._member_types.get(type_name)
+        if pairs is None:
+            pairs = []
+            for member in self.db.getMemberElems(type_name) or ():
+                type_elem = member.find("type")
+                if type_elem is not None:
+                    pairs.append((member, type_elem.text))
+            self._member_types[type_name] = pairs
+        return pairs
+
     def compute(self, type_name):
-        members = self.db.getMemberElems(type_name)
-        if not members:
-            return set()
-        types = ((member, member.find("type")) for member in members)
-        types = set(type_elem.text for (member, type_elem) in types
-                    if type_elem is not None and self.predicate(member))
-        all_types = set()
-        all_types.update(types)
-        for t in types:
-            referenced = self[t]
-            if referenced is not None:
-                # If not leading to a cycle
-                all_types.update(referenced)
-        return all_types
+        # Walk the referenced types depth-first with an explicit stack
+        # rather than recursing through self[t], reusing any results
+        # already computed. Every type the walk finishes is memoized too,
+        # so later lookups do not walk it again. Types that refer to each
+        # other in a cycle all reference the same types, so they are
+        # memoized together once the whole cycle is finished (Tarjan's
+        # strongly connected components algorithm).
+        index = {type_name: 0}
+        lowlink = {type_name: 0}
+        found = {type_name: set()}
+        unfinished = [type_name]
+        stack = [(type_name, iter(self.member_types(type_name)))]
+        while stack:
+            name, members = stack[-1]
+            for member, t in members:
+                if not self.predicate(member):
+                    continue
+                found[name].add(t)
+                referenced = self.d.get(t)
+                if referenced is not None:
+                    found[name].update(referenced)
+                elif t in index:
+                    # Still unfinished, so part of a cycle through name
+                    lowlink[name] = min(lowlink[name], index[t])
+                else:
+                    index[t] = lowlink[t] = len(index)
+                    found[t] = set()
+                    unfinished.append(t)
+                    stack.append((t, iter(self.member_types(t))))
+                    break
+            else:
+                stack.pop()
+                if lowlink[name] == index[name]:
+                    # name and the types above it are finished: memoize them
+                    all_types = found[name]
+                    while True:
+                        t = unfinished.pop()
+                        all_types.update(found[t])
+                        self.d[t] = all_types
+                        if t == name:
+                            break
+                if stack:
+                    parent = stack[-1][0]
+                    referenced = self.d.get(name)
+                    if referenced is not None:
+                        found[parent].update(referenced)
+                    else:
+                        lowlink[parent] = min(lowlink[parent], lowlink[name])
+        return self.d[type_name]
+
+
+class ReferencedInputAndApiTypes:
+    """Find all input types and all API types that are referenced by a
+    struct or function, recursively.
+
+    Holds one ReferencedTypes object for each, sharing a single cache of
+    member types, so each entity's members are read from the XML once for
+    both. Use input() and api() to retrieve one set or the other."""
+
+    def __init__(self, db, input_predicate, api_predicate):
+        """Initialize.
+
+        Provide an EntityDB object and the predicate functions for input
+        and API types, as would be passed to two ReferencedTypes objects."""
+        member_types = {}
+        self.input_types = ReferencedTypes(db, input_predicate, member_types)
+        self.api_types = ReferencedTypes(db, api_predicate, member_types)
+
+    def input(self, type_name):
+        """Return the set of input types referenced by type_name."""
+        return self.input_types[type_name]
+
+    def api(self, type_name):
+        """Return the set of API types referenced by type_name."""
+        return self.api_types[type_name]
 
 
 class HandleData:
@@ -540,16 +669,15 @@ class HandleData:
         if not self._descendants:
             # First time requested - compute it.
 
+            # Invert the ancestors relationship: each handle is a
+            # descendant of each of its ancestors.
             handle_parents = self.ancestors_dict
+            descendants = {h: set() for h in handle_parents.keys()}
+            for h, ancestors in handle_parents.items():
+                for ancestor in ancestors:
+                    descendants[ancestor].add(h)
 
-            def get_descendants(handle):
-                return set(h for h in handle_parents.keys()
-                           if handle in handle_parents[h])
-
-            self._descendants = {
-                h: get_descendants(h)
-                for h in handle_parents.keys()
-            }
+            self._descendants = descendants
         return self._descendants
 
 
@@ -581,17 +709,14 @@ def compute_type_to_codes(handle_data, types_to_codes, extra_op=None):
 
     extra_handle_codes = {}
     for handle_type, ancestors in handle_ancestors.items():
-        codes = set()
-        # The sets of return codes corresponding to each ancestor type.
-        ancestors_codes = (types_to_codes.get(ancestor, set())
-                           for ancestor in ancestors)
-        codes.union(*ancestors_codes)
-        # for parent_codes in ancestors_codes:
-        #     codes.update(parent_codes)
-        extra_handle_codes[handle_type] = codes
+        # The union of the sets of return codes corresponding to each
+        # ancestor type.
+        extra_handle_codes[handle_type] = set().union(
+            *(types_to_codes.get(ancestor, ()) for ancestor in ancestors))
 
+    codes_dict = types_to_codes.get_dict()
     for handle_type, extras in extra_handle_codes.items():
-        types_to_codes.add(handle_type, extras)
+        codes_dict.setdefault(handle_type, set()).update(extras)
 
     return types_to_codes
 
@@ -615,12 +740,13 @@ def compute_codes_requiring_type(handle_data, types_to_codes, registry=None):
 
     handle_descendants = handle_data.descendants_dict
 
-    out = DictOfStringSets()
+    out = defaultdict(set)
     for in_type, code_set in in_dict.items():
-        descendants = handle_descendants.get(in_type)
+        # The type itself and any descendants, computed once per type
+        # rather than once per code.
+        types = {in_type}
+        types.update(handle_descendants.get(in_type, ()))
         for code in code_set:
-            out.add(code, in_type)
-            if descendants:
-                out.add(code, descendants)
+            out[code].update(types)
 
-    return out
+    return DictOfStringSets(out)
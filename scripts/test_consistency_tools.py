@@ -0,0 +1,139 @@
+#!/usr/bin/python3 -i
+#
+# Copyright (c) 2019 Collabora, Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import xml.etree.ElementTree as etree
+
+import pytest
+
+from check_spec_links import VulkanEntityDatabase
+from spec_tools.algo import RecursiveMemoize
+from spec_tools.consistency_tools import (HandleData, ReferencedTypes,
+                                          XMLChecker, compute_type_to_codes)
+from vkconventions import VulkanConventions
+
+
+@pytest.fixture
+def handle_data():
+    return HandleData(VulkanEntityDatabase().registry)
+
+
+@pytest.fixture(scope='module')
+def checker():
+    return XMLChecker(VulkanEntityDatabase(), VulkanConventions())
+
+
+def test_type_to_codes_propagates_to_descendants(handle_data):
+    types_to_codes = compute_type_to_codes(
+        handle_data, {'VkInstance': 'VK_ERROR_INSTANCE_TEST'})
+
+    assert('VK_ERROR_INSTANCE_TEST' in types_to_codes['VkInstance'])
+    # VkDevice is a child of VkPhysicalDevice, a child of VkInstance
+    assert('VK_ERROR_INSTANCE_TEST' in types_to_codes['VkPhysicalDevice'])
+    assert('VK_ERROR_INSTANCE_TEST' in types_to_codes['VkDevice'])
+
+    # Codes do not propagate to ancestors
+    types_to_codes = compute_type_to_codes(
+        handle_data, {'VkDevice': 'VK_ERROR_DEVICE_TEST'})
+
+    assert('VK_ERROR_DEVICE_TEST' in types_to_codes['VkDevice'])
+    assert(not types_to_codes.get('VkInstance'))
+
+
+class RecursiveReferencedTypes(RecursiveMemoize):
+    """The original recursive ReferencedTypes algorithm, for comparison."""
+
+    def __init__(self, db, predicate):
+        self.db = db
+        self.predicate = predicate
+        super().__init__(permit_cycles=True)
+
+    def compute(self, type_name):
+        members = self.db.getMemberElems(type_name)
+        if not members:
+            return set()
+        types = ((member, member.find("type")) for member in members)
+        types = set(type_elem.text for (member, type_elem) in types
+                    if type_elem is not None and self.predicate(member))
+        all_types = set()
+        all_types.update(types)
+        for t in types:
+            referenced = self[t]
+            if referenced is not None:
+                # If not leading to a cycle
+                all_types.update(referenced)
+        return all_types
+
+
+def test_referenced_input_and_api_types(checker):
+    referenced = checker.referenced_types
+
+    # VkFence is an output of vkCreateFence but an input of vkWaitForFences
+    assert(referenced.input('vkCreateFence') == {
+        'VkAllocationCallbacks', 'VkDevice', 'VkFenceCreateFlags',
+        'VkFenceCreateInfo', 'VkStructureType'})
+    assert(referenced.api('vkCreateFence') == {
+        'VkAllocationCallbacks', 'VkDevice', 'VkFence', 'VkFenceCreateFlags',
+        'VkFenceCreateInfo', 'VkStructureType'})
+    assert(referenced.input('vkWaitForFences') == {
+        'VkBool32', 'VkDevice', 'VkFence'})
+
+    # VkBaseOutStructure refers to itself through pNext
+    assert('VkBaseOutStructure' in referenced.api('VkBaseOutStructure'))
+
+
+class MemberElemsDB:
+    """Looks up member elements by type name from a dict of XML strings."""
+
+    def __init__(self, members):
+        self.members = {name: [etree.fromstring(m) for m in member_xml]
+                        for name, member_xml in members.items()}
+
+    def getMemberElems(self, name):
+        return self.members.get(name)
+
+
+def test_referenced_types_through_cycle():
+    db = MemberElemsDB({
+        'C': ['<member><type>A</type> <name>a</name></member>'],
+        'A': ['<member><type>B</type> <name>b</name></member>'],
+        'B': ['<member><type>A</type> <name>a</name></member>',
+              '<member><type>D</type> <name>d</name></member>'],
+        'D': ['<member><type>E</type> <name>e</name></member>'],
+    })
+    referenced = ReferencedTypes(db)
+
+    assert(referenced['C'] == {'A', 'B', 'D', 'E'})
+    # Types finished during the walk from C are memoized along the way
+    assert(set(referenced.get_dict()) == {'A', 'B', 'C', 'D', 'E'})
+    assert(referenced['A'] == {'A', 'B', 'D', 'E'})
+    assert(referenced['B'] == {'A', 'B', 'D', 'E'})
+    assert(referenced['D'] == {'E'})
+    assert(referenced['E'] == set())
+
+
+def test_referenced_types_match_recursive_walk(checker):
+    db = checker.db
+    referenced = checker.referenced_types
+    input_types = RecursiveReferencedTypes(db, checker.is_input)
+    api_types = RecursiveReferencedTypes(db, checker.is_api_type)
+
+    names = list(db.registry.cmddict) + [
+        name for name, info in db.registry.typedict.items()
+        if info.elem.get('category') in ('struct', 'union')]
+    for name in names:
+        assert(referenced.input(name) == input_types[name])
+        assert(referenced.api(name) == api_types[name])
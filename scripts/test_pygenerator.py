@@ -0,0 +1,56 @@
+#!/usr/bin/python3 -i
+#
+# Copyright (c) 2013-2019 The Khronos Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import xml.etree.ElementTree as etree
+from types import SimpleNamespace
+
+import pytest
+
+from generator import GeneratorOptions
+from pygenerator import PyOutputGenerator
+from vkconventions import VulkanConventions
+
+
+@pytest.fixture
+def gen():
+    ret = PyOutputGenerator(diagFile=None)
+    ret.beginFile(GeneratorOptions(conventions=VulkanConventions()))
+    ret.featureName = 'VK_VERSION_1_0'
+    return ret
+
+
+def test_struct_members_without_type(gen):
+    elem = etree.fromstring(
+        '<type category="struct" name="VkTest">'
+        '<member><type>VkFlags</type> <name>a</name></member>'
+        '<member>int <name>b</name></member>'
+        '</type>')
+    gen.genStruct(SimpleNamespace(elem=elem), 'VkTest', None)
+
+    assert(gen.structs['VkTest'] == ('a', 'b'))
+    assert(gen.mapDict['VkTest'] == {'VkFlags'})
+
+
+def test_command_params_without_type(gen):
+    elem = etree.fromstring(
+        '<command><proto><type>void</type> <name>vkTest</name></proto>'
+        '<param><type>VkDevice</type> <name>device</name></param>'
+        '<param>int <name>count</name></param>'
+        '</command>')
+    gen.genCmd(SimpleNamespace(elem=elem), 'vkTest', None)
+
+    assert(gen.protos['vkTest'] == ('device', 'count'))
+    assert(gen.mapDict['vkTest'] == {'VkDevice'})